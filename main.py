@@ -1,10 +1,15 @@
 # main.py
 import asyncio
+import argparse
 import os
+import sys
 import json
+import hashlib
+import httpx
 import semantic_kernel as sk
-from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
+from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion, AzureTextEmbedding
 from semantic_kernel.planners.sequential_planner import SequentialPlanner
+from openai import AsyncAzureOpenAI
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -18,14 +23,26 @@ from src.agents.lead_reviewer_agent import LeadReviewerAgent
 
 # Import Plugins
 from src.plugins.document_parsing_plugin import DocumentParsingPlugin
-from src.plugins.image_comprehension_plugin import ImageComprehensionPlugin
+from src.plugins.image_comprehension_plugin import get_image_plugin
 from src.plugins.local_rule_loader_plugin import LocalRuleLoaderPlugin
 
-async def main():
+from src.cache.semantic_cache import EMBEDDING_SERVICE_ID
+from src.batch.azure_batch import run_batch
+from src.utils.http import close_http_client, get_http_client
+
+async def main(batch_mode: bool = False):
+    # One pooled HTTP client (keep-alive + HTTP/2) is shared by every Azure OpenAI call,
+    # so the vision/structural/security/lead calls reuse warm connections instead of re-handshaking.
+    try:
+        await orchestrate(get_http_client(), batch_mode=batch_mode)
+    finally:
+        await close_http_client()
+
+async def orchestrate(http_client: httpx.AsyncClient, batch_mode: bool = False):
     print("🚀 Starting Architecture Review Orchestrator...")
 
     # --- Configuration ---
-    # For GPT-3.5-turbo / fast text tasks
+    # For GPT-4o-mini / fast text tasks (must support json_schema structured outputs)
     AZURE_OPENAI_ENDPOINT_FAST = os.getenv("AZURE_OPENAI_ENDPOINT_FAST")
     AZURE_OPENAI_API_KEY_FAST = os.getenv("AZURE_OPENAI_API_KEY_FAST")
     AZURE_OPENAI_DEPLOYMENT_NAME_FAST = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME_FAST")       
@@ -39,6 +56,8 @@ async def main():
     AZURE_DOC_INTEL_ENDPOINT = os.getenv("AZURE_DOC_INTEL_ENDPOINT")
     AZURE_DOC_INTEL_API_KEY = os.getenv("AZURE_DOC_INTEL_API_KEY")
 
+    AZURE_OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION", "2025-01-01-preview")
+
     
 
     if not all([AZURE_OPENAI_ENDPOINT_FAST, AZURE_OPENAI_API_KEY_FAST, AZURE_OPENAI_DEPLOYMENT_NAME_FAST, AZURE_OPENAI_DEPLOYMENT_NAME_COMPLEX, 
@@ -46,6 +65,16 @@ async def main():
         print("Error: Missing one or more environment variables. Please check your .env file.")
         return
 
+    if batch_mode:
+        # Non-interactive runs submit the review prompts through the Azure OpenAI Batch API
+        AZURE_OPENAI_DEPLOYMENT_NAME_BATCH = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME_BATCH", AZURE_OPENAI_DEPLOYMENT_NAME_COMPLEX)
+        batch_client = AsyncAzureOpenAI(
+            azure_endpoint=AZURE_OPENAI_ENDPOINT_COMPLEX,
+            api_key=AZURE_OPENAI_API_KEY_COMPLEX,
+            api_version=os.getenv("AZURE_OPENAI_API_VERSION_BATCH", "2024-10-21"),
+            http_client=http_client
+        )
+
     # --- Initialize Semantic Kernel ---
     kernel = sk.Kernel()
 
@@ -54,11 +83,28 @@ async def main():
     complex_llm_service_id = "complex_llm"
     fast_llm_service_id = "fast_llm"
 
+    # Retries are handled by src/utils/retry.py; SDK retries on top would multiply the attempts per call
+    complex_client = AsyncAzureOpenAI(
+        azure_endpoint=AZURE_OPENAI_ENDPOINT_COMPLEX,
+        api_key=AZURE_OPENAI_API_KEY_COMPLEX,
+        api_version=AZURE_OPENAI_API_VERSION,
+        http_client=http_client,
+        max_retries=0
+    )
+    fast_client = AsyncAzureOpenAI(
+        azure_endpoint=AZURE_OPENAI_ENDPOINT_FAST,
+        api_key=AZURE_OPENAI_API_KEY_FAST,
+        api_version=AZURE_OPENAI_API_VERSION,
+        http_client=http_client,
+        max_retries=0
+    )
+
     kernel.add_service(
         AzureChatCompletion(
             deployment_name=AZURE_OPENAI_DEPLOYMENT_NAME_COMPLEX,
             endpoint=AZURE_OPENAI_ENDPOINT_COMPLEX,
             api_key=AZURE_OPENAI_API_KEY_COMPLEX,
+            async_client=complex_client,
             service_id=complex_llm_service_id # Service for complex tasks / vision
         ),
     )
@@ -67,9 +113,21 @@ async def main():
             deployment_name=AZURE_OPENAI_DEPLOYMENT_NAME_FAST,
             endpoint=AZURE_OPENAI_ENDPOINT_FAST,
             api_key=AZURE_OPENAI_API_KEY_FAST,
+            async_client=fast_client,
             service_id=fast_llm_service_id # Service for fast text-only tasks
         ),
     )
+    if os.getenv("AGENT_SEMANTIC_CACHE") == "1":
+        # Embeddings back the agents' semantic response cache
+        kernel.add_service(
+            AzureTextEmbedding(
+                deployment_name=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME_EMBEDDING", "text-embedding-3-small"),
+                endpoint=AZURE_OPENAI_ENDPOINT_COMPLEX,
+                api_key=AZURE_OPENAI_API_KEY_COMPLEX,
+                async_client=complex_client,
+                service_id=EMBEDDING_SERVICE_ID
+            ),
+        )
     print("✅ LLM services added.")
 
 
@@ -78,15 +136,16 @@ async def main():
     kernel.add_plugin(LocalRuleLoaderPlugin(), plugin_name="LocalRules")
     kernel.add_plugin(DocumentParsingPlugin(AZURE_DOC_INTEL_ENDPOINT, AZURE_DOC_INTEL_API_KEY), plugin_name="DocParser")
     # Image comprehension specifically uses the complex LLM for vision capabilities
-    kernel.add_plugin(ImageComprehensionPlugin(kernel, complex_llm_service_id), plugin_name="ImageIntel") 
+    kernel.add_plugin(get_image_plugin(kernel, complex_llm_service_id), plugin_name="ImageIntel") 
     print("✅ Utility plugins added.")
 
     # --- Initialize Agents (now inheriting from sk.agent.Agent) ---
     print("🤖 Initializing specialized agents with appropriate LLM services...")
     # Document processing for summarization can use the faster LLM
     doc_processing_agent = DocumentProcessingAgent(kernel, fast_llm_service_id)
-    # Validation, security, and lead review require more complex reasoning, use the complex LLM
-    structure_validator_agent = StructureValidatorAgent(kernel, complex_llm_service_id)
+    # Structural validation is rule matching + JSON emission, which the faster LLM handles well with structured outputs
+    structure_validator_agent = StructureValidatorAgent(kernel, fast_llm_service_id)
+    # Security and lead review require more complex reasoning, use the complex LLM
     security_architect_agent = SecurityArchitectAgent(kernel, complex_llm_service_id)
     lead_reviewer_agent = LeadReviewerAgent(kernel, complex_llm_service_id)
     print("✅ Agents initialized.")
@@ -121,29 +180,65 @@ async def main():
 
     print(f"\n🎯 Orchestration Goal: {goal}")
 
-    # --- Initialize the Planner ---
-    planner = SequentialPlanner(kernel=kernel, service_id=complex_llm_service_id) # Planner uses the complex LLM for reasoning
-
     # --- Create the Plan ---
-    print("\n📝 Creating the execution plan...")
-    plan = await planner.create_plan(goal)
-    print("Generated Plan:\n")
-    print(plan.as_xml())
-    print("-" * 50)
+    # The orchestration below is hand-coded, so the planner's LLM call is only made on request (SHOW_PLAN=1).
+    # The generated XML is cached per goal so repeated exploratory runs don't pay for it again.
+    if os.getenv("SHOW_PLAN"):
+        plan_cache_path = os.path.join(".cache", "plan", f"{hashlib.sha256(goal.encode('utf-8')).hexdigest()}.xml")
+        if os.path.exists(plan_cache_path):
+            print("\n📝 Loading the cached execution plan...")
+            with open(plan_cache_path, 'r', encoding='utf-8') as f:
+                plan_xml = f.read()
+        else:
+            print("\n📝 Creating the execution plan...")
+            planner = SequentialPlanner(kernel=kernel, service_id=complex_llm_service_id) # Planner uses the complex LLM for reasoning
+            plan = await planner.create_plan(goal)
+            plan_xml = plan.as_xml()
+            os.makedirs(os.path.dirname(plan_cache_path), exist_ok=True)
+            with open(plan_cache_path, 'w', encoding='utf-8') as f:
+                f.write(plan_xml)
+        print("Generated Plan:\n")
+        print(plan_xml)
+        print("-" * 50)
 
     # --- Execute the Plan ---
     print("\n[Orchestrator] Executing steps based on the plan's logical flow...")
 
     # Step 1: Process Document (always first)
     print("\n[Orchestrator] Invoking DocumentProcessor to summarize the document...")
-    comprehensive_summary = await doc_processing_agent.process_document(document_to_review)
-    print("✅ Document processing and summary complete.")
-    print(f"Comprehensive Summary (first 500 chars):\n{comprehensive_summary[:500]}...\n")
+    # The rules don't depend on the summary, so load them while the summary is being generated
+    rules_task = asyncio.create_task(structure_validator_agent.load_structural_rules())
+    print("Comprehensive Summary:\n")
+    # The summary is hashed as it streams, so the security review's cache lookup key is ready with the last token
+    summary_tokens = []
+    summary_hash = hashlib.sha256()
+    async for token in doc_processing_agent.process_document_stream(document_to_review):
+        summary_tokens.append(token)
+        summary_hash.update(token.encode("utf-8"))
+        sys.stdout.write(token)
+        sys.stdout.flush()
+    comprehensive_summary = "".join(summary_tokens)
+    if not batch_mode:
+        # The security review only needs the summary, so it is launched right away, alongside the validator,
+        # and discarded if the handoff pattern kicks in.
+        security_task = asyncio.create_task(security_architect_agent.review_document_security(comprehensive_summary, summary_hash.hexdigest()))
+    print("✅ Document processing and summary complete.\n")
+    structural_rules = await rules_task
 
 
     # Step 2: Structural Validation
-    print("\n[Orchestrator] Invoking StructureValidator to perform structural validation...")
-    structure_validation_result_json_str = await structure_validator_agent.validate_document_structure(comprehensive_summary)
+    if batch_mode:
+        print("\n[Orchestrator] Submitting StructureValidator and SecurityArchitect prompts as one batch job...")
+        batch_results = await run_batch(batch_client, AZURE_OPENAI_DEPLOYMENT_NAME_BATCH, {
+            "structure": structure_validator_agent.build_prompt(comprehensive_summary, structural_rules),
+            "security": security_architect_agent.build_prompt(comprehensive_summary)
+        })
+        structure_validation_result_json_str = structure_validator_agent.parse_report(batch_results["structure"])
+        security_task = asyncio.get_running_loop().create_future()
+        security_task.set_result(batch_results["security"])
+    else:
+        print("\n[Orchestrator] Invoking StructureValidator and SecurityArchitect concurrently...")
+        structure_validation_result_json_str = await structure_validator_agent.validate_document_structure(comprehensive_summary, structural_rules)
     structure_validation_data = json.loads(structure_validation_result_json_str)
     structural_report_text = structure_validation_data.get("report_text", "No structural report text.")
     has_critical_errors = structure_validation_data.get("has_critical_errors", False)
@@ -153,22 +248,27 @@ async def main():
     # --- Handoff Pattern ---
     if has_critical_errors:
         print("\n[Orchestrator] 🚨 CRITICAL STRUCTURAL ERRORS DETECTED. Halting further detailed reviews (Handoff Pattern).")
+        security_task.cancel()
         final_report_summary = f"Architecture review halted due to critical structural errors:\n{structure_validation_data.get('critical_error_reason', 'Reason not specified.')}"
-        final_report = await lead_reviewer_agent.consolidate_all_reports(
-            structural_report=structural_report_text,
-            other_reports_summary="No further detailed reviews performed due to critical structural errors. " + final_report_summary
+        # Nothing left to synthesize, so the final report is assembled locally instead of by the LeadReviewer
+        final_report = (
+            "# Architecture Review — HALTED\n\n"
+            "## Executive Summary\n"
+            "Critical structural errors prevented further review.\n\n"
+            f"## Structural Report\n{structural_report_text}\n\n"
+            f"## Reason\n{final_report_summary}"
         )
+        print("\n--- Final Architecture Review Document ---")
+        print(final_report)
     else:
         print("\n[Orchestrator] 👍 No critical structural errors. Proceeding with detailed reviews (Concurrent Pattern).")
         
         # --- Concurrent Execution ---
-        print("[Orchestrator] Initiating concurrent security review...")
-        
-        # We launch the security review concurrently
-        security_task = security_architect_agent.review_document_security(comprehensive_summary)
+        print("[Orchestrator] Awaiting concurrent security review...")
         
+        # The security review was already launched alongside the structural validation.
         # You can add more concurrent tasks here if you had other detailed review agents:
-        # infra_task = infra_architect_agent.review_document_infrastructure(comprehensive_summary)
+        # infra_task = asyncio.create_task(infra_architect_agent.review_document_infrastructure(comprehensive_summary))
         
         results = await asyncio.gather(security_task) # Add other tasks here: security_task, infra_task
         security_report = results[0] # Assuming security_task is the first in results
@@ -178,14 +278,33 @@ async def main():
 
         # --- Consolidation ---
         print("\n[Orchestrator] Consolidating all reports into the final document...")
-        final_report = await lead_reviewer_agent.consolidate_all_reports(
-            structural_report=structural_report_text,
-            other_reports_summary=f"Security Review Report:\n{security_report}"
-        )
+        other_reports_summary = f"Security Review Report:\n{security_report}"
+
+        if batch_mode:
+            # The consolidation depends on the reports above, so it is submitted as a second batch job
+            batch_results = await run_batch(batch_client, AZURE_OPENAI_DEPLOYMENT_NAME_BATCH, {
+                "final": lead_reviewer_agent.build_prompt(structural_report_text, other_reports_summary)
+            })
+            final_report = batch_results["final"]
+            print("\n--- Final Architecture Review Document ---")
+            print(final_report)
+        else:
+            print("\n--- Final Architecture Review Document ---")
+            # Stream the final document straight to stdout as the tokens arrive
+            final_report = ""
+            async for token in lead_reviewer_agent.consolidate_all_reports_stream(
+                structural_report=structural_report_text,
+                other_reports_summary=other_reports_summary
+            ):
+                final_report += token
+                sys.stdout.write(token)
+                sys.stdout.flush()
 
-    print("\n--- Final Architecture Review Document ---")
-    print(final_report)
     print("\n--- Orchestration Complete ---")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Architecture Review Orchestrator")
+    parser.add_argument("--batch", action="store_true",
+                        help="Submit the review prompts through the Azure OpenAI Batch API (lower cost, up to 24h turnaround).")
+    args = parser.parse_args()
+    asyncio.run(main(batch_mode=args.batch))
\ No newline at end of file
@@ -1,11 +1,59 @@
 # src/agents/document_processing_agent.py
 import os
 import base64
+import asyncio
+from typing import AsyncIterator
+from pypdf import PdfReader
 import semantic_kernel as sk
 from semantic_kernel.agents import Agent
 from semantic_kernel.functions import kernel_function
-from semantic_kernel.prompt_template.prompt_template_config import PromptTemplateConfig
-from semantic_kernel.prompt_template import PromptTemplate
+from src.cache.doc_cache import get_or_extract
+from src.utils.chat import SystemPromptChat
+from src.utils.retry import stream_with_retry, with_retry
+
+MAX_TOKENS = 1000
+TEMPERATURE = 0.2
+
+PROMPT_TEMPLATE = (
+    "You are an expert document summarizer. Summarize the following document content "
+    "into a comprehensive, concise, and professional design proposal summary. "
+    "Highlight the main components, proposed architecture, key features, and any "
+    "dependencies or external integrations mentioned. Focus on technical details relevant to an architecture review.\n\n"
+    "Document Content:\n{{"
+    "$"
+    "input}}\n\n"
+    "Comprehensive Design Proposal Summary:"
+)
+
+MAX_IMAGES = 5
+IMAGE_QUESTION = (
+    "This image comes from an architecture design document. Describe it in detail, "
+    "focusing on the components, data flows, and external integrations it shows."
+)
+# Formats the vision model accepts; pypdf also yields e.g. JPEG 2000 (.jp2) and TIFF images, which it rejects
+VISION_IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp")
+
+def _extract_pdf_images(file_path: str) -> list[str]:
+    """
+    Returns up to MAX_IMAGES base64 encoded images embedded in a PDF (none for other formats).
+    Images are optional context for the summary, so a PDF pypdf can't decode yields no images instead of an error.
+    """
+    if not file_path.lower().endswith(".pdf"):
+        return []
+    images = []
+    try:
+        for page in PdfReader(file_path).pages:
+            for image in page.images:
+                if not image.name.lower().endswith(VISION_IMAGE_EXTENSIONS):
+                    print(f"[DocumentProcessor] Skipping image '{image.name}': format not supported by the vision model")
+                    continue
+                images.append(base64.b64encode(image.data).decode("ascii"))
+                if len(images) >= MAX_IMAGES:
+                    return images
+    except Exception as e:
+        print(f"[DocumentProcessor] Could not extract images from {file_path}: {e}")
+        return []
+    return images
 
 class DocumentProcessingAgent(Agent):
     def __init__(self, kernel: sk.Kernel, service_id: str): # Service ID is now passed
@@ -24,6 +72,30 @@ class DocumentProcessingAgent(Agent):
         self._doc_parser = kernel.plugins["DocParser"]
         self._image_intel = kernel.plugins["ImageIntel"]
         self._llm = kernel.get_service(service_id) # Get the specific LLM service
+        self._execution_settings = self._llm.get_prompt_execution_settings(service_id=service_id, max_tokens=MAX_TOKENS, temperature=TEMPERATURE)
+        self._chat = SystemPromptChat(self._llm, self.instructions, self._execution_settings)
+
+    async def _describe_images(self, file_path: str) -> str:
+        images = await asyncio.to_thread(_extract_pdf_images, file_path)
+        if not images:
+            return ""
+        print(f"[DocumentProcessor] Comprehending {len(images)} image(s)...")
+        # The ImageComprehensionPlugin uses its own service_id set in main.py, which is the complex LLM.
+        # So no explicit service_id needed here for image_intel.invoke
+        # The plugin retries transient errors itself and reports failures as "Error: ..." text instead of raising
+        results = await asyncio.gather(*(
+            self._image_intel.invoke("ComprehendImage", sk.KernelArguments(image_base64=image, question=IMAGE_QUESTION))
+            for image in images
+        ))
+        descriptions = []
+        for i, result in enumerate(results, start=1):
+            description = str(result)
+            if description.startswith("Error"):
+                # Left out so the summarizer doesn't treat the error text as part of the design
+                print(f"[DocumentProcessor] Omitting image {i}: {description}")
+                continue
+            descriptions.append(description)
+        return "\n".join(f"- Image {i}: {description}" for i, description in enumerate(descriptions, start=1))
 
     @kernel_function(
         description="Processes a document to extract its full text, comprehend images, and generate a comprehensive summary.",
@@ -31,44 +103,29 @@ class DocumentProcessingAgent(Agent):
         input_description="The file path of the document (PDF, Word, etc.) to process."
     )
     async def process_document(self, file_path: str) -> str:
+        chunks = [chunk async for chunk in self.process_document_stream(file_path)]
+        return "".join(chunks)
+
+    async def process_document_stream(self, file_path: str) -> AsyncIterator[str]:
+        """
+        Same as process_document, but yields the summary tokens as the LLM produces them.
+        """
         print(f"[DocumentProcessor] Processing document: {file_path}")
 
-        # 1. Extract text content
-        document_text = await self._doc_parser.invoke("ExtractDocumentText", sk.KernelArguments(document_path=file_path))
+        # 1. Extract text content (cached by file content hash to skip repeat Doc Intelligence calls)
+        # 2. Comprehend images, concurrently with the text extraction since they use independent services
+        text_task = asyncio.create_task(get_or_extract(
+            file_path,
+            lambda: with_retry(self._doc_parser.invoke)("ExtractDocumentText", sk.KernelArguments(document_path=file_path))
+        ))
+        image_task = asyncio.create_task(self._describe_images(file_path))
+        document_text, image_summary = await asyncio.gather(text_task, image_task)
         print(f"[DocumentProcessor] Extracted text content length: {len(document_text)}")
-
-        # 2. Comprehend images (assuming image extraction logic from document_parsing_plugin could provide base64 images)
-        # For this prototype, we'll simulate image processing as extract_document_text doesn't return image data directly.
-        # In a real scenario, Document Intelligence could extract images or you'd use a separate image extraction step.
-        image_summary = ""
-        # The ImageComprehensionPlugin uses its own service_id set in main.py, which is the complex LLM.
-        # So no explicit service_id needed here for image_intel.invoke
+        full_content_to_summarize = f"{document_text}\n\nImages:\n{image_summary}" if image_summary else f"{document_text}"
 
         # 3. Summarize using LLM (using the fast_llm service)
-        prompt_template = PromptTemplate(
-            template=(
-                "You are an expert document summarizer. Summarize the following document content "
-                "into a comprehensive, concise, and professional design proposal summary. "
-                "Highlight the main components, proposed architecture, key features, and any "
-                "dependencies or external integrations mentioned. Focus on technical details relevant to an architecture review.\n\n"
-                "Document Content:\n{{"
-                "$"
-                "input}}\n\n"
-                "Comprehensive Design Proposal Summary:"
-            ),
-            prompt_template_config=PromptTemplateConfig(
-                input_variables=[sk.semantickernel.input_variable.InputVariable(name="input", description="The document content to summarize.")],
-                execution_settings=self._llm.get_prompt_execution_settings(service_id=self.service_id, max_tokens=1000, temperature=0.2)
-            )
-        )
-        
         # Ensure the LLM service used here is self._llm, which corresponds to fast_llm
-        response = await self._llm.get_chat_message_content(
-            messages=full_content_to_summarize,
-            prompt_template=prompt_template,
-            kernel=self._kernel 
-        )
-        
-        comprehensive_summary = response.content
-        print("[DocumentProcessor] Document summarized successfully.")
-        return comprehensive_summary
\ No newline at end of file
+        async for token in stream_with_retry(lambda: self._chat.stream(PROMPT_TEMPLATE.replace("{{$input}}", full_content_to_summarize))):
+            yield token
+
+        print("\n[DocumentProcessor] Document summarized successfully.")
\ No newline at end of file
@@ -1,8 +1,36 @@
 # src/agents/lead_reviewer_agent.py
+import asyncio
+from typing import AsyncIterator
 import semantic_kernel as sk
 from semantic_kernel.agents import Agent
 from semantic_kernel.functions import kernel_function
-from semantic_kernel.prompt_template import PromptTemplate, PromptTemplateConfig
+from src.cache.semantic_cache import SemanticCache, cached_stream
+from src.utils.tokens import trim_to_tokens
+from src.utils.chat import SystemPromptChat
+from src.utils.retry import stream_with_retry
+
+MAX_TOKENS = 1500
+TEMPERATURE = 0.2
+MAX_INPUT_TOKENS = 4000
+# The final document's scaffold is known in advance; as a predicted output the model can skip emitting it
+PREDICTED_OUTPUT = (
+    "# Final Architecture Review Document\n\n"
+    "## Executive Summary\n\n"
+    "## Structural Findings\n\n"
+    "## Security Findings\n\n"
+    "## Recommendations\n"
+)
+
+PROMPT_TEMPLATE = (
+    "As the Lead Architect Reviewer, synthesize the following review findings into a "
+    "single, professional, and comprehensive Final Architecture Review Document. "
+    "Provide an Executive Summary, detailed findings from each review section, "
+    "and clear, actionable recommendations.\n\n"
+    "Review Findings:\n{{"
+    "$"
+    "input}}\n\n"
+    "Final Architecture Review Document:"
+)
 
 class LeadReviewerAgent(Agent):
     def __init__(self, kernel: sk.Kernel, service_id: str = "default"):
@@ -19,6 +47,40 @@ class LeadReviewerAgent(Agent):
             )
         )
         self._llm = kernel.get_service(service_id)
+        self._semantic_cache = SemanticCache.from_env(kernel, namespace=self.name)
+        self._execution_settings = self._llm.get_prompt_execution_settings(
+            service_id=service_id,
+            max_tokens=MAX_TOKENS,
+            temperature=TEMPERATURE,
+            extra_body={"prediction": {"type": "content", "content": PREDICTED_OUTPUT}}
+        )
+        self._chat = SystemPromptChat(self._llm, self.instructions, self._execution_settings)
+        # Only needed to match cache entries, so skipped when no cache is configured
+        self._cache_context = SemanticCache.context_hash(PROMPT_TEMPLATE, self._execution_settings) if self._semantic_cache else ""
+
+    @staticmethod
+    def _combine_reports(structural_report: str, other_reports_summary: str) -> str:
+        report_details = f"Structural Review:\n{structural_report}\n\n"
+        if other_reports_summary:
+            report_details += f"Detailed Reviews Summary:\n{trim_to_tokens(other_reports_summary, MAX_INPUT_TOKENS)}\n"
+        else:
+            report_details += "Detailed reviews were not performed or results were not available.\n"
+        return report_details
+
+    def build_prompt(self, structural_report: str, other_reports_summary: str = "") -> dict:
+        """
+        Returns the chat completion request body (without the model) for the final consolidation,
+        so the prompt can be serialized, e.g. into a batch job, without invoking the LLM.
+        """
+        report_details = self._combine_reports(structural_report, other_reports_summary)
+        return {
+            "messages": [
+                {"role": "system", "content": self.instructions},
+                {"role": "user", "content": PROMPT_TEMPLATE.replace("{{$input}}", report_details)}
+            ],
+            "max_tokens": MAX_TOKENS,
+            "temperature": TEMPERATURE
+        }
 
     @kernel_function(
         description="Consolidates various review reports into a single, final architecture review document.",
@@ -27,37 +89,25 @@ class LeadReviewerAgent(Agent):
                           "If 'other_reports_summary' is empty, indicate that no further reviews were performed."
     )
     async def consolidate_all_reports(self, structural_report: str, other_reports_summary: str = "") -> str:
-        print("[LeadReviewer] Starting final report consolidation...")
+        chunks = [chunk async for chunk in self.consolidate_all_reports_stream(structural_report, other_reports_summary)]
+        return "".join(chunks)
 
-        report_details = f"Structural Review:\n{structural_report}\n\n"
-        if other_reports_summary:
-            report_details += f"Detailed Reviews Summary:\n{other_reports_summary}\n"
-        else:
-            report_details += "Detailed reviews were not performed or results were not available.\n"
+    async def consolidate_all_reports_stream(self, structural_report: str, other_reports_summary: str = "") -> AsyncIterator[str]:
+        """
+        Same as consolidate_all_reports, but yields the final document tokens as the LLM produces them.
+        """
+        print("[LeadReviewer] Starting final report consolidation...")
 
-        prompt_template = PromptTemplate(
-            template=(
-                "As the Lead Architect Reviewer, synthesize the following review findings into a "
-                "single, professional, and comprehensive Final Architecture Review Document. "
-                "Provide an Executive Summary, detailed findings from each review section, "
-                "and clear, actionable recommendations.\n\n"
-                "Review Findings:\n{{"
-                "$"
-                "input}}\n\n"
-                "Final Architecture Review Document:"
-            ),
-            prompt_template_config=PromptTemplateConfig(
-                input_variables=[sk.semantickernel.input_variable.InputVariable(name="input", description="The combined review reports.")],
-                execution_settings=self._llm.get_prompt_execution_settings(service_id=self.service_id, max_tokens=1500, temperature=0.2)
-            )
-        )
+        # _combine_reports tokenizes the summary; a worker thread keeps that off the event loop
+        report_details = await asyncio.to_thread(self._combine_reports, structural_report, other_reports_summary)
 
-        consolidation_function = self._llm.get_chat_message_content(
-            messages=report_details,
-            prompt_template=prompt_template,
-            kernel=self._kernel
-        )
+        user_message = PROMPT_TEMPLATE.replace("{{$input}}", report_details)
+        async for token in cached_stream(
+            self._semantic_cache,
+            report_details,
+            self._cache_context,
+            lambda: stream_with_retry(lambda: self._chat.stream(user_message))
+        ):
+            yield token
 
-        final_report = await consolidation_function
-        print("[LeadReviewer] Final report consolidation completed.")
-        return final_report.content
\ No newline at end of file
+        print("\n[LeadReviewer] Final report consolidation completed.")
\ No newline at end of file
@@ -1,8 +1,28 @@
 # src/agents/security_architect_agent.py
+import asyncio
+from typing import AsyncIterator, Optional
 import semantic_kernel as sk
 from semantic_kernel.agents import Agent
 from semantic_kernel.functions import kernel_function
-from semantic_kernel.prompt_template import PromptTemplate, PromptTemplateConfig
+from src.cache.semantic_cache import SemanticCache, cached_stream
+from src.utils.tokens import trim_to_tokens
+from src.utils.chat import SystemPromptChat
+from src.utils.retry import stream_with_retry
+
+MAX_TOKENS = 700
+TEMPERATURE = 0.3
+MAX_INPUT_TOKENS = 4000
+
+PROMPT_TEMPLATE = (
+    "As a cybersecurity architect, conduct a thorough security review of the following "
+    "design proposal summary. Focus on identifying potential vulnerabilities, "
+    "compliance concerns, and areas where security best practices could be applied or improved. "
+    "Provide actionable recommendations.\n\n"
+    "Design Proposal Summary:\n{{"
+    "$"
+    "input}}\n\n"
+    "Security Review Report (Concise and Actionable):"
+)
 
 class SecurityArchitectAgent(Agent):
     def __init__(self, kernel: sk.Kernel, service_id: str = "default"):
@@ -20,38 +40,55 @@ class SecurityArchitectAgent(Agent):
             )
         )
         self._llm = kernel.get_service(service_id)
+        self._semantic_cache = SemanticCache.from_env(kernel, namespace=self.name)
+        self._execution_settings = self._llm.get_prompt_execution_settings(service_id=service_id, max_tokens=MAX_TOKENS, temperature=TEMPERATURE)
+        self._chat = SystemPromptChat(self._llm, self.instructions, self._execution_settings)
+        # Only needed to match cache entries, so skipped when no cache is configured
+        self._cache_context = SemanticCache.context_hash(PROMPT_TEMPLATE, self._execution_settings) if self._semantic_cache else ""
+
+    def build_prompt(self, comprehensive_summary: str) -> dict:
+        """
+        Returns the chat completion request body (without the model) for a security review,
+        so the prompt can be serialized, e.g. into a batch job, without invoking the LLM.
+        """
+        comprehensive_summary = trim_to_tokens(comprehensive_summary, MAX_INPUT_TOKENS)
+        return {
+            "messages": [
+                {"role": "system", "content": self.instructions},
+                {"role": "user", "content": PROMPT_TEMPLATE.replace("{{$input}}", comprehensive_summary)}
+            ],
+            "max_tokens": MAX_TOKENS,
+            "temperature": TEMPERATURE
+        }
 
     @kernel_function(
         description="Reviews a design document summary for security vulnerabilities and compliance.",
         name="ReviewDocumentSecurity",
         input_description="The comprehensive summary of the design document."
     )
-    async def review_document_security(self, comprehensive_summary: str) -> str:
+    async def review_document_security(self, comprehensive_summary: str, summary_digest: Optional[str] = None) -> str:
+        chunks = [chunk async for chunk in self.review_document_security_stream(comprehensive_summary, summary_digest)]
+        return "".join(chunks)
+
+    async def review_document_security_stream(self, comprehensive_summary: str, summary_digest: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Same as review_document_security, but yields the report tokens as the LLM produces them.
+        'summary_digest' is the sha256 hex digest of the untrimmed summary, if the caller already computed it;
+        it lets the semantic cache answer an identical summary without embedding it.
+        """
         print("[SecurityArchitect] Starting security review...")
+        summary_digest = summary_digest or SemanticCache.digest(comprehensive_summary)
+        # Tokenizing a long summary would block the event loop the other agents stream on
+        comprehensive_summary = await asyncio.to_thread(trim_to_tokens, comprehensive_summary, MAX_INPUT_TOKENS)
 
-        prompt_template = PromptTemplate(
-            template=(
-                "As a cybersecurity architect, conduct a thorough security review of the following "
-                "design proposal summary. Focus on identifying potential vulnerabilities, "
-                "compliance concerns, and areas where security best practices could be applied or improved. "
-                "Provide actionable recommendations.\n\n"
-                "Design Proposal Summary:\n{{"
-                "$"
-                "input}}\n\n"
-                "Security Review Report (Concise and Actionable):"
-            ),
-            prompt_template_config=PromptTemplateConfig(
-                input_variables=[sk.semantickernel.input_variable.InputVariable(name="input", description="The document summary for security review.")],
-                execution_settings=self._llm.get_prompt_execution_settings(service_id=self.service_id, max_tokens=700, temperature=0.3)
-            )
-        )
-        
-        security_review_function = self._llm.get_chat_message_content(
-            messages=comprehensive_summary,
-            prompt_template=prompt_template,
-            kernel=self._kernel
-        )
+        user_message = PROMPT_TEMPLATE.replace("{{$input}}", comprehensive_summary)
+        async for token in cached_stream(
+            self._semantic_cache,
+            comprehensive_summary,
+            self._cache_context,
+            lambda: stream_with_retry(lambda: self._chat.stream(user_message)),
+            summary_digest
+        ):
+            yield token
 
-        security_report = await security_review_function
-        print("[SecurityArchitect] Security review completed.")
-        return security_report.content
\ No newline at end of file
+        print("\n[SecurityArchitect] Security review completed.")
\ No newline at end of file
@@ -1,9 +1,76 @@
 # src/agents/structure_validator_agent.py
+import io
+import csv
 import json
+import asyncio
+from typing import Literal, Optional
+from pydantic import BaseModel, ValidationError
 import semantic_kernel as sk
 from semantic_kernel.agents import Agent
 from semantic_kernel.functions import kernel_function
-from semantic_kernel.prompt_template import PromptTemplate, PromptTemplateConfig
+from src.cache.semantic_cache import SemanticCache, cached_chat
+from src.utils.chat import SystemPromptChat
+from src.utils.retry import with_retry
+
+MAX_TOKENS = 1500
+TEMPERATURE = 0.0
+# Rules are evaluated in groups of this size, one parallel LLM call per group
+RULES_PER_GROUP = 5
+
+class RuleEvaluation(BaseModel):
+    id: str
+    status: Literal["Met", "Violated", "Not Applicable"]
+    explanation: Optional[str] = None
+
+class StructuralReport(BaseModel):
+    rule_evaluations: list[RuleEvaluation]
+    has_critical_errors: bool
+    critical_error_reason: Optional[str] = None
+
+# Structured outputs: the model's reply is constrained to the StructuralReport schema.
+# Needs a deployment that supports json_schema (gpt-4o-mini, or gpt-4o 2024-08-06 or later).
+RESPONSE_FORMAT = StructuralReport
+
+def _strict_schema(schema: dict) -> dict:
+    # Structured outputs' strict mode needs every property required, no extra properties and no defaults
+    if isinstance(schema.get("properties"), dict):
+        schema["required"] = list(schema["properties"])
+        schema["additionalProperties"] = False
+    schema.pop("default", None)
+    for key in ("properties", "$defs"):
+        for sub_schema in schema.get(key, {}).values():
+            _strict_schema(sub_schema)
+    if isinstance(schema.get("items"), dict):
+        _strict_schema(schema["items"])
+    for sub_schema in schema.get("anyOf", []):
+        _strict_schema(sub_schema)
+    return schema
+
+def _response_format_param(model: type[BaseModel]) -> dict:
+    """
+    Returns the strict json_schema response_format for a pydantic model, i.e. the request field
+    the live path sends when RESPONSE_FORMAT is set on the execution settings.
+    """
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": model.__name__, "schema": _strict_schema(model.model_json_schema()), "strict": True}
+    }
+
+PROMPT_TEMPLATE = (
+    "As an architectural document structural validator, analyze the following design proposal summary "
+    "against the provided **structural rules**. For each rule, state if it's 'Met', 'Violated', or 'Not Applicable'. " # UPDATED PROMPT LANGUAGE
+    "If violated, provide a brief explanation. "
+    "Finally, determine if any *critical* rules are violated. "
+    "Output your findings as a JSON object with 'rule_evaluations' (list of rule ID, status, explanation), "
+    "and 'has_critical_errors' (boolean). If 'has_critical_errors' is true, include a 'critical_error_reason' string.\n\n"
+    "Design Proposal Summary:\n{{"
+    "$"
+    "input_summary}}\n\n"
+    "Structural Rules:\n{{"
+    "$"
+    "input_rules}}\n\n"
+    "JSON Report:"
+)
 
 class StructureValidatorAgent(Agent):
     def __init__(self, kernel: sk.Kernel, service_id: str = "default"):
@@ -19,73 +86,107 @@ class StructureValidatorAgent(Agent):
                 "Identify if any *critical* rules are violated. "
                 "Generate a detailed report in JSON format, indicating the rule evaluation and "
                 "a boolean flag for 'has_critical_errors'. If critical errors are found, "
-                "provide a concise reason. The JSON should be wrapped in ```json tags."
+                "provide a concise reason. Respond with the JSON object only."
             )
         )
         self._local_rule_loader = kernel.plugins["LocalRules"]
         self._llm = kernel.get_service(service_id)
+        self._semantic_cache = SemanticCache.from_env(kernel, namespace=self.name)
+        self._execution_settings = self._llm.get_prompt_execution_settings(service_id=service_id, max_tokens=MAX_TOKENS, temperature=TEMPERATURE, response_format=RESPONSE_FORMAT)
+        self._chat = SystemPromptChat(self._llm, self.instructions, self._execution_settings)
+        # Only needed to match cache entries, so skipped when no cache is configured
+        self._cache_context = SemanticCache.context_hash(PROMPT_TEMPLATE, self._execution_settings) if self._semantic_cache else ""
+
+    async def load_structural_rules(self) -> str:
+        structural_rules = await self._local_rule_loader.invoke("LoadRules", sk.KernelArguments(rule_file_name="structural_rules.yaml"))
+        print(f"[StructureValidator] Loaded structural rules: \n{str(structural_rules)[:200]}...") # Print first 200 chars
+        return str(structural_rules)
+
+    def build_prompt(self, comprehensive_summary: str, structural_rules: str) -> dict:
+        """
+        Returns the chat completion request body (without the model) for a structural validation,
+        so the prompt can be serialized, e.g. into a batch job, without invoking the LLM.
+        """
+        prompt = PROMPT_TEMPLATE.replace("{{$input_summary}}", comprehensive_summary).replace("{{$input_rules}}", structural_rules)
+        return {
+            "messages": [
+                {"role": "system", "content": self.instructions},
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": MAX_TOKENS,
+            "temperature": TEMPERATURE,
+            # The same strict schema the live path sends for RESPONSE_FORMAT
+            "response_format": _response_format_param(RESPONSE_FORMAT)
+        }
 
     @kernel_function(
         description="Validates a design document summary against structural rules.",
         name="ValidateDocumentStructure",
         input_description="The comprehensive summary of the design document."
     )
-    async def validate_document_structure(self, comprehensive_summary: str) -> str:
+    async def validate_document_structure(self, comprehensive_summary: str, structural_rules: str = "") -> str:
+        """
+        'structural_rules' may be pre-fetched with load_structural_rules() while the summary is being produced.
+        """
         print("[StructureValidator] Starting structural validation...")
         
-        # Load structural rules - UPDATED FILE NAME HERE
-        structural_rules = await self._local_rule_loader.invoke("LoadRules", sk.KernelArguments(rule_file_name="structural_rules.yaml"))
-        print(f"[StructureValidator] Loaded structural rules: \n{structural_rules[:200]}...") # Print first 200 chars
-
-        prompt_template = PromptTemplate(
-            template=(
-                "As an architectural document structural validator, analyze the following design proposal summary "
-                "against the provided **structural rules**. For each rule, state if it's 'Met', 'Violated', or 'Not Applicable'. " # UPDATED PROMPT LANGUAGE
-                "If violated, provide a brief explanation. "
-                "Finally, determine if any *critical* rules are violated. "
-                "Output your findings as a JSON object with 'rule_evaluations' (list of rule ID, status, explanation), "
-                "and 'has_critical_errors' (boolean). If 'has_critical_errors' is true, include a 'critical_error_reason' string.\n\n"
-                "Design Proposal Summary:\n{{"
-                "$"
-                "input_summary}}\n\n"
-                "Structural Rules:\n{{"
-                "$"
-                "input_rules}}\n\n"
-                "JSON Report:"
-            ),
-            prompt_template_config=PromptTemplateConfig(
-                input_variables=[
-                    sk.semantickernel.input_variable.InputVariable(name="input_summary", description="The document summary."),
-                    sk.semantickernel.input_variable.InputVariable(name="input_rules", description="The structural rules to evaluate against.")
-                ],
-                execution_settings=self._llm.get_prompt_execution_settings(service_id=self.service_id, max_tokens=1500, temperature=0.0)
-            )
-        )
-        
-        validation_function = self._llm.get_chat_message_content(
-            messages=sk.contents.chat_history.ChatHistory().add_user_message(f"Input Summary:\n{comprehensive_summary}\n\nRules:\n{structural_rules}"),
-            prompt_template=prompt_template,
-            kernel=self._kernel
-        )
+        if not structural_rules:
+            structural_rules = await self.load_structural_rules()
 
-        raw_response = await validation_function
-        report_str = raw_response.content.strip()
+        # Smaller per-group prompts run in parallel and keep one bad JSON answer from hiding the other rules
+        rule_lines = [line for line in structural_rules.splitlines() if line.strip()]
+        rule_groups = ["\n".join(rule_lines[i:i + RULES_PER_GROUP]) for i in range(0, len(rule_lines), RULES_PER_GROUP)] or [structural_rules]
+        raw_contents = await asyncio.gather(*(self._evaluate_rules(comprehensive_summary, group) for group in rule_groups))
+        return self.parse_report(*raw_contents)
 
-        # Extract JSON from markdown if present
-        if report_str.startswith("```json") and report_str.endswith("```"):
-            report_str = report_str[len("```json"): -len("```")].strip()
+    async def _evaluate_rules(self, comprehensive_summary: str, structural_rules: str) -> str:
+        cache_input = f"Input Summary:\n{comprehensive_summary}\n\nRules:\n{structural_rules}"
+        user_message = PROMPT_TEMPLATE.replace("{{$input_summary}}", comprehensive_summary).replace("{{$input_rules}}", structural_rules)
+
+        return await cached_chat(
+            self._semantic_cache,
+            cache_input,
+            self._cache_context,
+            lambda: with_retry(self._chat.complete)(user_message)
+        )
+
+    def parse_report(self, *raw_contents: str) -> str:
+        """
+        Parses the LLM's StructuralReport verdicts (one per rule group), merges them and returns a JSON string
+        with an added 'report_text' field. A group whose output doesn't match the schema is reported as a critical error
+        while the other groups' verdicts are kept.
+        """
+        validation_data = {"rule_evaluations": [], "has_critical_errors": False}
+        critical_error_reasons = []
 
         try:
-            validation_data = json.loads(report_str)
+            for group_index, raw_content in enumerate(raw_contents, start=1):
+                # Each group is parsed on its own so one malformed answer doesn't discard the other groups' verdicts
+                try:
+                    group_report = StructuralReport.model_validate_json(raw_content)
+                except ValidationError as e:
+                    print(f"[StructureValidator] Structured output validation error in rule group {group_index}: {e}")
+                    print(f"Raw response: {raw_content}")
+                    validation_data['has_critical_errors'] = True
+                    critical_error_reasons.append(
+                        f"Validation agent produced malformed JSON output for rule group {group_index}: {e}. Raw output: {raw_content[:200]}..."
+                    )
+                    continue
+                validation_data['rule_evaluations'].extend(evaluation.model_dump() for evaluation in group_report.rule_evaluations)
+                if group_report.has_critical_errors:
+                    validation_data['has_critical_errors'] = True
+                    critical_error_reasons.append(group_report.critical_error_reason or 'Reason not provided.')
+            if critical_error_reasons:
+                validation_data['critical_error_reason'] = " ".join(critical_error_reasons)
             print("[StructureValidator] Structural validation completed.")
             
-            # Add a 'report_text' field for the consolidated report
-            validation_data['report_text'] = f"Structural Validation Report:\n"
+            # Add a 'report_text' field for the consolidated report, one compact CSV row per rule
+            report_rows = io.StringIO()
+            writer = csv.writer(report_rows, lineterminator="\n")
+            writer.writerow(["rule", "status", "explanation"])
             for eval in validation_data.get('rule_evaluations', []):
-                validation_data['report_text'] += f"- Rule {eval.get('id')}: {eval.get('status')}"
-                if eval.get('explanation'):
-                    validation_data['report_text'] += f" - {eval.get('explanation')}"
-                validation_data['report_text'] += "\n"
+                writer.writerow([eval.get('id'), eval.get('status'), eval.get('explanation') or ""])
+            validation_data['report_text'] = f"Structural Validation Report:\n{report_rows.getvalue()}"
             
             if validation_data.get('has_critical_errors'):
                 validation_data['report_text'] += f"\nCRITICAL ERRORS DETECTED: {validation_data.get('critical_error_reason', 'Reason not provided.')}\n"
@@ -94,15 +195,6 @@ class StructureValidatorAgent(Agent):
 
             return json.dumps(validation_data)
 
-        except json.JSONDecodeError as e:
-            print(f"[StructureValidator] JSON parsing error: {e}")
-            print(f"Raw response: {report_str}")
-            return json.dumps({
-                "rule_evaluations": [],
-                "has_critical_errors": True, # Assume critical error if JSON is malformed
-                "critical_error_reason": f"Validation agent produced malformed JSON output: {e}. Raw output: {report_str[:200]}...",
-                "report_text": f"Structural Validation Failed: Malformed response from agent. {e}. Raw output: {report_str[:200]}..."
-            })
         except Exception as e:
             print(f"[StructureValidator] Unexpected error during validation: {e}")
             return json.dumps({
@@ -0,0 +1,60 @@
+# src/batch/azure_batch.py
+import json
+import asyncio
+from openai import AsyncAzureOpenAI
+
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+async def run_batch(client: AsyncAzureOpenAI, deployment: str, requests: dict[str, dict],
+                    initial_poll_seconds: float = 10.0, max_poll_seconds: float = 300.0) -> dict[str, str]:
+    """
+    Submits chat completion request bodies as a single Azure OpenAI Batch job and waits for it to finish.
+    'requests' maps a custom ID to a request body (as returned by an agent's build_prompt()).
+    Returns a mapping of custom ID to the completion text.
+    """
+    lines = [
+        json.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/chat/completions",
+            "body": {"model": deployment, **body}
+        })
+        for custom_id, body in requests.items()
+    ]
+    batch_file = await client.files.create(
+        file=("review_batch.jsonl", "\n".join(lines).encode("utf-8")),
+        purpose="batch"
+    )
+    batch = await client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/chat/completions",
+        completion_window="24h"
+    )
+    print(f"[Batch] Submitted batch {batch.id} with {len(lines)} request(s).")
+
+    # Poll with exponential backoff; batch jobs can take minutes to hours
+    delay = initial_poll_seconds
+    while batch.status not in TERMINAL_STATUSES:
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, max_poll_seconds)
+        batch = await client.batches.retrieve(batch.id)
+        print(f"[Batch] Batch {batch.id} status: {batch.status}")
+
+    if batch.status != "completed" or not batch.output_file_id:
+        raise RuntimeError(f"Batch {batch.id} ended with status '{batch.status}'.")
+
+    output = await client.files.content(batch.output_file_id)
+    results = {}
+    for line in output.text.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        response = record.get("response") or {}
+        if response.get("status_code") != 200:
+            raise RuntimeError(f"Batch request '{record.get('custom_id')}' failed: {record.get('error') or response}")
+        results[record["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+
+    missing = set(requests) - set(results)
+    if missing:
+        raise RuntimeError(f"Batch {batch.id} returned no result for: {', '.join(sorted(missing))}")
+    return results
@@ -0,0 +1,72 @@
+# src/cache/doc_cache.py
+import os
+import mmap
+import time
+import asyncio
+import hashlib
+import tempfile
+from typing import Awaitable, Callable, Optional
+
+CACHE_DIR = os.path.join(".cache", "docintel")
+CACHE_TTL_SECONDS = int(os.getenv("DOC_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+def file_sha256(path: str) -> str:
+    """
+    Returns the SHA-256 hex digest of the file contents.
+    The file is memory-mapped rather than read into a bytes object, so multi-MB PDFs don't inflate RSS.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return digest.hexdigest() # mmap can't map an empty file
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            digest.update(mm)
+    return digest.hexdigest()
+
+def _is_fresh(cache_path: str) -> bool:
+    try:
+        st = os.stat(cache_path)
+    except FileNotFoundError:
+        return False
+    # An empty entry means a previous write was interrupted; an old one has outlived its TTL
+    return st.st_size > 0 and (time.time() - st.st_mtime) < CACHE_TTL_SECONDS
+
+def _read_fresh(cache_path: str) -> Optional[str]:
+    # Returns the cached text, or None on a miss or an expired entry
+    if not _is_fresh(cache_path):
+        return None
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None # Removed between the stat and the open
+
+def _write_atomic(cache_path: str, content: str) -> None:
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+async def get_or_extract(path: str, extractor: Callable[[], Awaitable[object]]) -> str:
+    """
+    Returns the extracted text for the document at 'path', keyed by the SHA-256 of its bytes.
+    On a cache miss the extractor (e.g. the Doc Intelligence plugin) is awaited and its result
+    is written to .cache/docintel/<sha256>.txt so re-reviews of the same file skip the API call.
+    """
+    # All file I/O runs in worker threads, so it doesn't stall the image comprehension running alongside
+    cache_path = os.path.join(CACHE_DIR, f"{await asyncio.to_thread(file_sha256, path)}.txt")
+    cached = await asyncio.to_thread(_read_fresh, cache_path)
+    if cached is not None:
+        print(f"[DocCache] Cache hit for {path}")
+        return cached
+
+    content = str(await extractor())
+    await asyncio.to_thread(_write_atomic, cache_path, content)
+    return content
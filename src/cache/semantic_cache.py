@@ -0,0 +1,170 @@
+# src/cache/semantic_cache.py
+import os
+import json
+import math
+import hashlib
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Optional
+from pydantic import BaseModel
+import semantic_kernel as sk
+
+CACHE_DIR = os.path.join(".cache", "semantic")
+EMBEDDING_SERVICE_ID = "embedding"
+SIMILARITY_THRESHOLD = float(os.getenv("AGENT_SEMANTIC_CACHE_THRESHOLD", "0.95"))
+
+def _cosine(a: list[float], b: list[float], norm_b: float) -> float:
+    norm_a = math.sqrt(sum(x * x for x in a))
+    if not norm_a or not norm_b:
+        return 0.0
+    return sum(x * y for x, y in zip(a, b)) / (norm_a * norm_b)
+
+class SemanticCache:
+    """
+    A per-agent cache of LLM completions keyed by the embedding of the prompt input.
+    Entries are only matched when the prompt template and execution settings hash to the same value,
+    so the similarity search only compares the variable part of the prompt.
+    An exact match on the sha256 digest of the input is served before any embedding is computed.
+    Entries are persisted as JSON lines in .cache/semantic/<namespace>.jsonl.
+    """
+    def __init__(self, kernel: sk.Kernel, namespace: str, embedding_service_id: str = EMBEDDING_SERVICE_ID,
+                 threshold: float = SIMILARITY_THRESHOLD):
+        self._embedder = kernel.get_service(embedding_service_id)
+        self._threshold = threshold
+        self._path = os.path.join(CACHE_DIR, f"{namespace}.jsonl")
+        self._entries: Optional[list[dict]] = None
+
+    @classmethod
+    def from_env(cls, kernel: sk.Kernel, namespace: str) -> Optional["SemanticCache"]:
+        """
+        Returns a cache for the namespace when AGENT_SEMANTIC_CACHE=1, otherwise None.
+        """
+        if os.getenv("AGENT_SEMANTIC_CACHE") != "1":
+            return None
+        return cls(kernel, namespace)
+
+    @staticmethod
+    def context_hash(template: str, settings) -> str:
+        """
+        Hashes the static part of a request (prompt template + execution settings).
+        A pydantic response_format class can't be serialized, so its JSON schema is hashed in its place.
+        """
+        if hasattr(settings, "model_dump"):
+            settings_data = settings.model_dump(exclude={"response_format": True, "extension_data": {"response_format"}}, exclude_none=True, mode="json")
+            response_format = getattr(settings, "response_format", None)
+            if isinstance(response_format, type) and issubclass(response_format, BaseModel):
+                settings_data["response_format"] = response_format.model_json_schema()
+            elif response_format is not None:
+                settings_data["response_format"] = response_format
+            settings_json = json.dumps(settings_data, sort_keys=True, default=str)
+        else:
+            settings_json = str(settings)
+        return hashlib.sha256(f"{template}\n{settings_json}".encode("utf-8")).hexdigest()
+
+    def _load(self) -> list[dict]:
+        if self._entries is None:
+            self._entries = []
+            if os.path.exists(self._path):
+                with open(self._path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        # A write interrupted mid-line leaves a partial entry; skip it rather than disabling the cache
+                        try:
+                            entry = json.loads(line)
+                        except json.JSONDecodeError:
+                            print(f"[SemanticCache] Skipping unreadable entry in '{os.path.basename(self._path)}'")
+                            continue
+                        entry["norm"] = math.sqrt(sum(x * x for x in entry["embedding"]))
+                        self._entries.append(entry)
+        return self._entries
+
+    @staticmethod
+    def digest(prompt_input: str) -> str:
+        return hashlib.sha256(prompt_input.encode("utf-8")).hexdigest()
+
+    async def lookup(self, prompt_input: str, context: str, digest: Optional[str] = None) -> tuple[Optional[list[float]], Optional[str]]:
+        """
+        Returns (embedding, cached response or None). 'digest' identifies the input exactly (it defaults to
+        the sha256 of prompt_input); on an exact hit no embedding is computed and None is returned in its place.
+        """
+        digest = digest or self.digest(prompt_input)
+        for entry in self._load():
+            if entry.get("digest") == digest and entry["settings_hash"] == context:
+                print(f"[SemanticCache] Exact cache hit in '{os.path.basename(self._path)}'")
+                return None, entry["response"]
+
+        embeddings = await self._embedder.generate_embeddings([prompt_input])
+        embedding = [float(x) for x in embeddings[0]]
+
+        best_score, best_response = 0.0, None
+        for entry in self._load():
+            if entry["settings_hash"] != context:
+                continue
+            score = _cosine(embedding, entry["embedding"], entry["norm"])
+            if score > best_score:
+                best_score, best_response = score, entry["response"]
+
+        if best_score >= self._threshold:
+            print(f"[SemanticCache] Cache hit in '{os.path.basename(self._path)}' (similarity {best_score:.3f})")
+            return embedding, best_response
+        return embedding, None
+
+    async def store(self, embedding: list[float], response: str, context: str, digest: Optional[str] = None) -> None:
+        entry = {"embedding": embedding, "response": response, "settings_hash": context, "digest": digest}
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(self._path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + "\n")
+        entry["norm"] = math.sqrt(sum(x * x for x in embedding))
+        self._load().append(entry)
+
+async def _lookup(cache: SemanticCache, prompt_input: str, context: str,
+                  digest: str) -> tuple[Optional[list[float]], Optional[str]]:
+    # The cache is an optimization: an embedding or I/O failure is treated as a miss so the LLM call still runs
+    try:
+        return await cache.lookup(prompt_input, context, digest)
+    except Exception as e:
+        print(f"[SemanticCache] Lookup failed, treating as a miss: {e}")
+        return None, None
+
+async def _store(cache: SemanticCache, embedding: Optional[list[float]], response: str, context: str, digest: str) -> None:
+    if embedding is None:
+        return
+    try:
+        await cache.store(embedding, response, context, digest)
+    except Exception as e:
+        print(f"[SemanticCache] Failed to store entry: {e}")
+
+async def cached_chat(cache: Optional[SemanticCache], prompt_input: str, context: str,
+                      call: Callable[[], Awaitable[str]], digest: Optional[str] = None) -> str:
+    """
+    Returns a cached completion for a semantically equivalent prompt input, or awaits 'call' and caches it.
+    'digest' may be passed when the caller already hashed the input, e.g. incrementally while it streamed in.
+    With no cache configured this is a plain passthrough, and cache failures fall back to calling the LLM.
+    """
+    if cache is None:
+        return await call()
+    digest = digest or SemanticCache.digest(prompt_input)
+    embedding, cached = await _lookup(cache, prompt_input, context, digest)
+    if cached is not None:
+        return cached
+    response = await call()
+    await _store(cache, embedding, response, context, digest)
+    return response
+
+async def cached_stream(cache: Optional[SemanticCache], prompt_input: str, context: str,
+                        stream: Callable[[], AsyncIterable[str]], digest: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Streaming variant of cached_chat: a hit is yielded as a single chunk, a miss is streamed
+    through and stored once the stream completes.
+    """
+    if cache is None:
+        async for token in stream():
+            yield token
+        return
+    digest = digest or SemanticCache.digest(prompt_input)
+    embedding, cached = await _lookup(cache, prompt_input, context, digest)
+    if cached is not None:
+        yield cached
+        return
+    tokens = []
+    async for token in stream():
+        tokens.append(token)
+        yield token
+    await _store(cache, embedding, "".join(tokens), context, digest)
@@ -1,11 +1,47 @@
 # src/plugins/local_rule_loader_plugin.py
 import os
+import asyncio
 import yaml
+import aiofiles
 from semantic_kernel import kernel_function
 
 class LocalRuleLoaderPlugin:
     def __init__(self, rules_dir: str = "rules"):
         self._rules_dir = rules_dir
+        # Formatted rules per file name, with the st_mtime_ns they were parsed at
+        self._cache: dict[str, tuple[int, str]] = {}
+        if os.path.isdir(rules_dir):
+            for rule_file_name in os.listdir(rules_dir):
+                if rule_file_name.endswith((".yaml", ".yml")):
+                    try:
+                        self._parse_and_cache(rule_file_name)
+                    except Exception:
+                        pass # Surfaced by load_rules when the file is actually requested
+
+    @staticmethod
+    def _format_rules(rules: list) -> str:
+        # Convert list of dicts to a readable string for the LLM
+        return "\n".join([f"- {rule.get('id')}: {rule.get('description')} (Critical: {rule.get('critical')})" for rule in rules])
+
+    def _parse_and_cache(self, rule_file_name: str) -> str:
+        file_path = os.path.join(self._rules_dir, rule_file_name)
+        mtime_ns = os.stat(file_path).st_mtime_ns
+        with open(file_path, 'r', encoding='utf-8') as f:
+            rules = yaml.safe_load(f)
+        formatted = self._format_rules(rules)
+        self._cache[rule_file_name] = (mtime_ns, formatted)
+        return formatted
+
+    async def _parse_and_cache_async(self, rule_file_name: str) -> str:
+        # Same as _parse_and_cache, without blocking the event loop on disk reads or YAML parsing
+        file_path = os.path.join(self._rules_dir, rule_file_name)
+        mtime_ns = (await asyncio.to_thread(os.stat, file_path)).st_mtime_ns
+        async with aiofiles.open(file_path, 'r', encoding='utf-8') as f:
+            data = await f.read()
+        rules = await asyncio.to_thread(yaml.safe_load, data)
+        formatted = self._format_rules(rules)
+        self._cache[rule_file_name] = (mtime_ns, formatted)
+        return formatted
 
     @kernel_function(
         description="Loads a set of rules from a local YAML file.",
@@ -15,14 +51,15 @@ class LocalRuleLoaderPlugin:
     async def load_rules(self, rule_file_name: str) -> str:
         """
         Loads rules from a specified YAML file in the 'rules' directory.
+        Rules are parsed once and served from memory until the file's mtime changes.
         """
         file_path = os.path.join(self._rules_dir, rule_file_name)
         if not os.path.exists(file_path):
             return f"Error: Rule file '{rule_file_name}' not found at {file_path}"
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                rules = yaml.safe_load(f)
-            # Convert list of dicts to a readable string for the LLM
-            return "\n".join([f"- {rule.get('id')}: {rule.get('description')} (Critical: {rule.get('critical')})" for rule in rules])
+            cached = self._cache.get(rule_file_name)
+            if cached and cached[0] == os.stat(file_path).st_mtime_ns:
+                return cached[1]
+            return await self._parse_and_cache_async(rule_file_name)
         except Exception as e:
-            return f"Error loading rules from {rule_file_name}: {e}"
\ No newline at end of file
+            return f"Error loading rules from {rule_file_name}: {e}"
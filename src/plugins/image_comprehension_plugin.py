@@ -1,54 +1,284 @@
 # src/plugins/image_comprehension_plugin.py
+import io
+import os
+import re
+import base64
+import hashlib
+import asyncio
+import logging
+from collections import OrderedDict
+from PIL import Image
+from typing import AsyncIterator, Literal, Optional
+import orjson
+from openai import AsyncStream
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
 import semantic_kernel as sk
 from semantic_kernel import kernel_function
 from semantic_kernel.connectors.ai.open_ai import AzureChatCompletion
-from semantic_kernel.contents.chat_history import ChatHistory
-from semantic_kernel.contents.chat_message_content import ChatMessageContent
-from semantic_kernel.prompt_template.prompt_template_config import PromptTemplateConfig
-from semantic_kernel.prompt_template import PromptTemplate
+from src.utils.retry import stream_with_retry
+
+logger = logging.getLogger(__name__)
+
+# OpenAI's vision 'detail' hint: "low" sends one 512px tile (85 tokens), "high" tiles the full image
+ImageDetail = Literal["low", "high", "auto"]
+
+# Leading base64 characters of common image formats' magic bytes
+_BASE64_MIME_PREFIXES = {"/9j/": "image/jpeg", "iVBORw0KGgo": "image/png", "R0lGOD": "image/gif", "UklGR": "image/webp"}
+
+# Longest edge sent to the vision model; larger images are scaled down and re-encoded as JPEG
+MAX_IMAGE_EDGE = 1568
+JPEG_QUALITY = 85
+# Base64 characters decoded to read an image's dimensions (a multiple of 4, so it decodes on its own).
+# Enough for PNG/GIF headers and for JPEG frame headers behind typical EXIF blocks.
+HEADER_PREFIX_CHARS = 64 * 1024
+
+def _image_size(image_base64: str) -> Optional[tuple[int, int]]:
+    # Reads the dimensions from a decoded prefix of the image, so images that already fit
+    # are never fully decoded; None if the header doesn't fit in the prefix
+    if len(image_base64) <= HEADER_PREFIX_CHARS:
+        return None
+    try:
+        return Image.open(io.BytesIO(base64.b64decode(image_base64[:HEADER_PREFIX_CHARS]))).size
+    except Exception:
+        return None
+
+def _maybe_downscale(image_base64: str, max_edge: int = MAX_IMAGE_EDGE) -> str:
+    """
+    Returns the image scaled down so its longest edge is at most max_edge, re-encoded as JPEG.
+    Images that already fit, or that Pillow can't read, are returned unchanged.
+    """
+    size = _image_size(image_base64)
+    if size and max(size) <= max_edge:
+        return image_base64
+    try:
+        img = Image.open(io.BytesIO(base64.b64decode(image_base64))) # Lazy: only the header is parsed here
+        if max(img.size) <= max_edge:
+            return image_base64
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+            # JPEG has no alpha; flatten onto white so dark line art on a transparent background stays visible
+            img = img.convert("RGBA")
+            flattened = Image.new("RGB", img.size, "white")
+            flattened.paste(img, mask=img.getchannel("A"))
+            img = flattened
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=JPEG_QUALITY)
+        return base64.b64encode(out.getvalue()).decode("ascii")
+    except Exception:
+        logger.warning("Could not downscale image; sending it as-is", exc_info=True)
+        return image_base64
+
+# Cheap sanity check on the start of the payload; the service remains the authority on the full image
+_B64_RE = re.compile(r'[A-Za-z0-9+/]+={0,2}')
+_B64_SAMPLE_CHARS = 4096
+
+def _looks_like_base64(image_base64: str) -> bool:
+    return len(image_base64) % 4 == 0 and _B64_RE.fullmatch(image_base64[:_B64_SAMPLE_CHARS]) is not None
+
+def _mime_type(image_base64: str) -> str:
+    for prefix, mime_type in _BASE64_MIME_PREFIXES.items():
+        if image_base64.startswith(prefix):
+            return mime_type
+    return "image/jpeg"
+
+# In-memory LRU of vision answers keyed by sha256(image) + sha256(question) + detail, so a repeated
+# image/question pair skips the vision model round-trip entirely
+_VISION_CACHE: OrderedDict[bytes, str] = OrderedDict()
+_VISION_CACHE_MAX = 256
+
+def _read_bytes(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+def _vision_cache_key(image_base64: str, question: str, detail: ImageDetail) -> bytes:
+    return hashlib.sha256(image_base64.encode("utf-8")).digest() + hashlib.sha256(question.encode("utf-8")).digest() + detail.encode("ascii")
+
+def _remember(key: bytes, content: str) -> None:
+    _VISION_CACHE[key] = content
+    if len(_VISION_CACHE) > _VISION_CACHE_MAX:
+        _VISION_CACHE.popitem(last=False)
+
+# Calls currently waiting on the vision model; identical concurrent calls await the first one's result
+_INFLIGHT: dict[bytes, asyncio.Future] = {}
+
+# Constant fields of every vision request body
+_REQUEST_TEMPLATE = {"stream": True, "stream_options": {"include_usage": True}}
+
+def _request_body(question: str, image_url: str, detail: ImageDetail, user_id: Optional[str]) -> bytes:
+    # orjson writes the multi-MB base64 data URL at close to memcpy speed, where the SDK's stdlib encoder scans it
+    payload = {
+        **_REQUEST_TEMPLATE,
+        "messages": [{
+            "role": "user",
+            "content": [
+                {"type": "text", "text": question},
+                {"type": "image_url", "image_url": {"url": image_url, "detail": detail}}
+            ]
+        }]
+    }
+    if user_id is not None:
+        # A stable 'user' lets Azure route a user's repeat requests to the same prompt cache
+        payload["user"] = user_id
+    return orjson.dumps(payload)
+
+# Vision requests allowed in flight per plugin; a burst beyond this queues locally instead of
+# exhausting the connection pool and tripping Azure's rate limits
+MAX_CONCURRENT_REQUESTS = int(os.getenv("VISION_MAX_CONCURRENCY", "8"))
 
 class ImageComprehensionPlugin:
-    def __init__(self, kernel: sk.Kernel, chat_service_id: str):
+    def __init__(self, kernel: sk.Kernel, chat_service_id: str, max_concurrency: int = MAX_CONCURRENT_REQUESTS):
         self._kernel = kernel
         self._chat_service_id = chat_service_id # Store the specific service ID
         self._chat_service = kernel.get_service(chat_service_id) # Get the service instance
+        # Vision needs an AzureChatCompletion; checked once here rather than on every call
+        if not isinstance(self._chat_service, AzureChatCompletion):
+            raise TypeError("Chat service must be an AzureChatCompletion instance for image comprehension.")
+        # Vision requests are posted as pre-serialized JSON through the service's own Azure OpenAI client.
+        # A bytes body skips the SDK's model-based deployment routing, so the deployment path is spelled out.
+        self._client = self._chat_service.client
+        self._completions_path = f"/deployments/{self._chat_service.ai_model_id}/chat/completions"
+        self._semaphore = asyncio.Semaphore(max_concurrency)
 
     @kernel_function(
         description="Analyzes an image and provides a detailed description or answers questions about its content.",
         name="ComprehendImage",
         input_description="A base64 encoded string of the image, and a question about its content."
     )
-    async def comprehend_image(self, image_base64: str, question: str) -> str:
+    async def comprehend_image(self, image_base64: str, question: str, user_id: Optional[str] = None,
+                               detail: ImageDetail = "auto") -> str:
         """
         Comprehends an image given its base64 encoded string and a question about it.
+        'user_id' is sent as the request's 'user' so Azure's prompt caching can apply per user.
+        'detail' can be set to "low" for thumbnails and icons, which need far fewer image tokens.
         """
+        if not _looks_like_base64(image_base64):
+            logger.warning("Rejected an image that is not valid base64")
+            return "Error: Could not comprehend image due to invalid base64 image data"
+        key = _vision_cache_key(image_base64, question, detail)
+        cached = _VISION_CACHE.get(key)
+        if cached is not None:
+            _VISION_CACHE.move_to_end(key)
+            return cached
+
+        inflight = _INFLIGHT.get(key)
+        if inflight is not None:
+            # Shielded, so a cancelled follower doesn't cancel the call the others are waiting on
+            return await asyncio.shield(inflight)
+        future = asyncio.get_running_loop().create_future()
+        _INFLIGHT[key] = future
         try:
-            # Ensure the service is an AzureChatCompletion for vision capabilities
-            if not isinstance(self._chat_service, AzureChatCompletion):
-                raise TypeError("Chat service must be an AzureChatCompletion instance for image comprehension.")
-
-            chat_history = ChatHistory()
-            chat_history.add_user_message(
-                [
-                    ChatMessageContent(role=sk.AuthorRole.USER, content=question),
-                    ChatMessageContent(role=sk.AuthorRole.USER, image_base64=image_base64)
-                ]
-            )
+            content = await self._comprehend(key, image_base64, question, user_id, detail)
+            future.set_result(content)
+            return content
+        finally:
+            del _INFLIGHT[key]
+            if not future.done():
+                future.cancel() # The first caller was cancelled; its followers are cancelled with it
 
-            # Use a basic prompt as the question itself is part of the message content
-            prompt_config = PromptTemplateConfig("{{$input}}")
-            prompt_template = PromptTemplate(prompt_config)
-            
-            # Use the specific chat service for vision
-            vision_function = self._chat_service.get_chat_message_content(
-                chat_history=chat_history,
-                prompt_template=prompt_template,
-                kernel=self._kernel # Pass the kernel
-            )
-            
-            response = await vision_function
-            return response.content
+    @kernel_function(
+        description="Analyzes an image file and provides a detailed description or answers questions about its content.",
+        name="ComprehendImageFile",
+        input_description="The file path of the image, and a question about its content."
+    )
+    async def comprehend_image_path(self, image_path: str, question: str, user_id: Optional[str] = None,
+                                    detail: ImageDetail = "auto") -> str:
+        """
+        Same as comprehend_image, for an image on disk. The file is read off the event loop.
+        """
+        return await self.comprehend_image_bytes(await asyncio.to_thread(_read_bytes, image_path), question, user_id, detail)
+
+    async def comprehend_image_bytes(self, image: bytes, question: str, user_id: Optional[str] = None,
+                                     detail: ImageDetail = "auto") -> str:
+        """
+        Same as comprehend_image, for raw image bytes. Base64 encoding runs in a worker thread,
+        so large images don't stall the event loop.
+        """
+        image_base64 = await asyncio.to_thread(base64.b64encode, image)
+        return await self.comprehend_image(image_base64.decode("ascii"), question, user_id, detail)
+
+    async def comprehend_image_stream(self, image_base64: str, question: str, user_id: Optional[str] = None,
+                                      detail: ImageDetail = "auto") -> AsyncIterator[str]:
+        """
+        Same as comprehend_image, but yields the answer as the vision model produces it.
+        A cached answer is yielded as a single chunk; a completed answer is cached.
+        """
+        if not _looks_like_base64(image_base64):
+            logger.warning("Rejected an image that is not valid base64")
+            yield "Error: Could not comprehend image due to invalid base64 image data"
+            return
+        key = _vision_cache_key(image_base64, question, detail)
+        cached = _VISION_CACHE.get(key)
+        if cached is not None:
+            _VISION_CACHE.move_to_end(key)
+            yield cached
+            return
+
+        chunks = []
+        try:
+            async for token in self._stream_vision(image_base64, question, user_id, detail):
+                chunks.append(token)
+                yield token
+        except Exception as e:
+            logger.exception("Error comprehending image")
+            yield f"Error: Could not comprehend image due to {e}"
+            return
+        _remember(key, "".join(chunks))
+
+    async def _comprehend(self, key: bytes, image_base64: str, question: str, user_id: Optional[str], detail: ImageDetail) -> str:
+        try:
+            content = "".join([token async for token in self._stream_vision(image_base64, question, user_id, detail)])
+            # Errors are returned below without being cached, so a later call can retry
+            _remember(key, content)
+            return content
 
         except Exception as e:
-            print(f"Error comprehending image: {e}")
-            return f"Error: Could not comprehend image due to {e}"
\ No newline at end of file
+            logger.exception("Error comprehending image")
+            return f"Error: Could not comprehend image due to {e}"
+
+    async def _stream_vision(self, image_base64: str, question: str, user_id: Optional[str], detail: ImageDetail) -> AsyncIterator[str]:
+        # Downscaling only happens on a cache miss, and the cache stays keyed on the caller's image
+        image_base64 = await asyncio.to_thread(_maybe_downscale, image_base64)
+        body = _request_body(question, f"data:{_mime_type(image_base64)};base64,{image_base64}", detail, user_id)
+        # Throttling and 5xx errors are retried with backoff until the first token arrives
+        async for token in stream_with_retry(lambda: self._post_stream(body)):
+            yield token
+
+    async def _post_stream(self, body: bytes) -> AsyncIterator[str]:
+        # The slot is held until the stream is consumed, since the connection is busy until then
+        async with self._semaphore:
+            stream = await self._client.post(
+                self._completions_path,
+                content=body,
+                cast_to=ChatCompletion,
+                stream=True,
+                stream_cls=AsyncStream[ChatCompletionChunk]
+            )
+            async for chunk in stream:
+                if chunk.usage is not None and logger.isEnabledFor(logging.DEBUG):
+                    # Shows whether Azure served the prompt prefix from its cache
+                    details = chunk.usage.prompt_tokens_details
+                    logger.debug("Vision call used %s prompt tokens (%s cached)", chunk.usage.prompt_tokens, details.cached_tokens if details else 0)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+# Constructed plugins per (kernel identity, chat service ID)
+_PLUGINS: OrderedDict[tuple[int, str], ImageComprehensionPlugin] = OrderedDict()
+_PLUGINS_MAX = 8
+
+def get_image_plugin(kernel: sk.Kernel, chat_service_id: str) -> ImageComprehensionPlugin:
+    """
+    Returns the ImageComprehensionPlugin for a kernel and chat service, constructing it only once.
+    Kernels aren't hashable, so they are keyed by id(); a cached plugin holds a reference to its kernel,
+    so that id can't be reused while the entry exists.
+    """
+    key = (id(kernel), chat_service_id)
+    plugin = _PLUGINS.get(key)
+    if plugin is not None:
+        _PLUGINS.move_to_end(key)
+        return plugin
+    plugin = _PLUGINS[key] = ImageComprehensionPlugin(kernel, chat_service_id)
+    if len(_PLUGINS) > _PLUGINS_MAX:
+        _PLUGINS.popitem(last=False)
+    return plugin
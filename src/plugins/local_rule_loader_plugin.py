@@ -1,10 +1,70 @@
+import os
+import logging
+import threading
+from typing import Optional
 import semantic_kernel as sk
 from semantic_kernel.functions import kernel_function
 
+logger = logging.getLogger(__name__)
+
+# Rule file contents per path: (st_mtime_ns, st_size, raw bytes, decoded text or None).
+# The text is decoded once, on the first load_structure_rules hit, and reused until the file changes.
+_RULES_CACHE: dict[str, tuple[int, int, bytes, Optional[str]]] = {}
+
+def _read_bytes(file_path: str, size: int) -> bytes:
+    # Unbuffered, so the whole file is returned by (usually) a single read() call sized to the file
+    # instead of going through the default 8 KiB buffer
+    with open(file_path, 'rb', buffering=0) as f:
+        data = os.read(f.fileno(), size)
+        while len(data) < size:
+            more = os.read(f.fileno(), size - len(data))
+            if not more:
+                break # The file shrank since it was stat'ed
+            data += more
+        return data
+
+def _cached_entry(file_path: str) -> tuple[int, int, bytes, Optional[str]]:
+    st = os.stat(file_path)
+    cached = _RULES_CACHE.get(file_path)
+    if cached and cached[:2] == (st.st_mtime_ns, st.st_size):
+        return cached
+    entry = (st.st_mtime_ns, st.st_size, _read_bytes(file_path, st.st_size), None)
+    _RULES_CACHE[file_path] = entry
+    return entry
+
+def _load_cached(file_path: str) -> bytes:
+    return _cached_entry(file_path)[2]
+
+def _load_text(file_path: str) -> str:
+    mtime_ns, size, raw, text = _cached_entry(file_path)
+    if text is None:
+        text = raw.decode('utf-8')
+        _RULES_CACHE[file_path] = (mtime_ns, size, raw, text)
+    return text
+
+def _preload(file_paths: list[str]) -> None:
+    for file_path in file_paths:
+        try:
+            _load_cached(file_path)
+        except Exception:
+            pass # Surfaced by load_structure_rules when the file is actually requested
+
 class LocalRuleLoaderPlugin:
     """
     A Semantic Kernel plugin to load rules from local text files.
     """
+    def __init__(self, preload_paths: Optional[list[str]] = None, rules_dir: str = "rules"):
+        # Known rule files are read into the cache on a background thread, so the first
+        # load_structure_rules call doesn't pay for the disk read on the request path.
+        # Without explicit paths, every file in the rules directory is preloaded.
+        if preload_paths is None and os.path.isdir(rules_dir):
+            preload_paths = [
+                os.path.join(rules_dir, rule_file_name) for rule_file_name in os.listdir(rules_dir)
+                if os.path.isfile(os.path.join(rules_dir, rule_file_name))
+            ]
+        if preload_paths:
+            threading.Thread(target=_preload, args=(list(preload_paths),), name="RulePreload", daemon=True).start()
+
     @kernel_function(
         name="load_structure_rules",
         description="Loads structural validation rules from a local text file.",
@@ -13,15 +73,23 @@ class LocalRuleLoaderPlugin:
     def load_structure_rules(self, file_path: str) -> str:
         """
         Loads rules from a specified local text file.
+        Contents are cached in memory, decoded once, until the file's mtime or size changes.
         """
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                rules = f.read()
-            print(f"DEBUG: Successfully loaded rules from {file_path}")
+            rules = _load_text(file_path)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Successfully loaded rules from %s", file_path)
             return rules
         except FileNotFoundError:
-            print(f"ERROR: Rules file not found at {file_path}")
+            logger.error("Rules file not found at %s", file_path)
             return "Error: Rules file not found."
         except Exception as e:
-            print(f"ERROR: Failed to load rules from {file_path}: {e}")
-            return f"Error loading rules: {str(e)}"
\ No newline at end of file
+            logger.exception("Failed to load rules from %s", file_path)
+            return f"Error loading rules: {str(e)}"
+
+    def load_structure_rules_raw(self, file_path: str) -> bytes:
+        """
+        Same as load_structure_rules, but returns the cached UTF-8 bytes without decoding them.
+        Errors are raised rather than returned as text.
+        """
+        return _load_cached(file_path)
@@ -0,0 +1,35 @@
+# src/utils/chat.py
+from typing import AsyncIterator
+from semantic_kernel.connectors.ai.chat_completion_client_base import ChatCompletionClientBase
+from semantic_kernel.connectors.ai.prompt_execution_settings import PromptExecutionSettings
+from semantic_kernel.contents.chat_history import ChatHistory
+
+class SystemPromptChat:
+    """
+    Sends single-turn chat requests that all share the same system message and execution settings.
+    The system message is identical on every call; building it once also keeps a stable
+    prompt prefix for Azure OpenAI's automatic prompt caching.
+    """
+    def __init__(self, llm: ChatCompletionClientBase, system_message: str, settings: PromptExecutionSettings):
+        self._llm = llm
+        self._settings = settings
+        self._base_history = ChatHistory()
+        self._base_history.add_system_message(system_message)
+
+    def history(self, user_message: str) -> ChatHistory:
+        # Copies the messages list so the shared system prefix is never mutated
+        history = ChatHistory(messages=[*self._base_history.messages])
+        history.add_user_message(user_message)
+        return history
+
+    async def complete(self, user_message: str) -> str:
+        response = await self._llm.get_chat_message_content(chat_history=self.history(user_message), settings=self._settings)
+        return response.content
+
+    async def stream(self, user_message: str) -> AsyncIterator[str]:
+        async for chunk in self._llm.get_streaming_chat_message_content(
+            chat_history=self.history(user_message),
+            settings=self._settings
+        ):
+            if chunk and chunk.content:
+                yield chunk.content
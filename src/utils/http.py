@@ -0,0 +1,33 @@
+# src/utils/http.py
+from typing import Optional
+import httpx
+
+MAX_CONNECTIONS = 64
+MAX_KEEPALIVE_CONNECTIONS = 32
+TIMEOUT_SECONDS = 60
+
+_SHARED_HTTPX: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Returns the process-wide pooled HTTP client (keep-alive + HTTP/2). Every Azure OpenAI client,
+    including the one behind the ImageComprehensionPlugin's vision service, should be built on it,
+    so concurrent calls reuse warm connections instead of paying a TLS handshake each.
+    """
+    global _SHARED_HTTPX
+    if _SHARED_HTTPX is None or _SHARED_HTTPX.is_closed:
+        _SHARED_HTTPX = httpx.AsyncClient(
+            http2=True,
+            timeout=TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS)
+        )
+    return _SHARED_HTTPX
+
+async def close_http_client() -> None:
+    """
+    Closes the shared client; call it on shutdown from the event loop that used it.
+    """
+    global _SHARED_HTTPX
+    if _SHARED_HTTPX is not None:
+        await _SHARED_HTTPX.aclose()
+        _SHARED_HTTPX = None
@@ -0,0 +1,47 @@
+# src/utils/retry.py
+from typing import AsyncIterable, AsyncIterator, Callable
+from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+from azure.core.exceptions import HttpResponseError, ServiceRequestError
+from tenacity import AsyncRetrying, retry, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+def is_transient_error(exc: BaseException) -> bool:
+    """
+    True for throttling, timeouts and 5xx errors from Azure OpenAI or Doc Intelligence.
+    Semantic Kernel wraps provider errors, so the whole __cause__ chain is inspected.
+    """
+    while exc is not None:
+        if isinstance(exc, (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError, ServiceRequestError)):
+            return True
+        if isinstance(exc, HttpResponseError) and exc.status_code in TRANSIENT_STATUS_CODES:
+            return True
+        exc = exc.__cause__
+    return False
+
+def _retrying_kwargs() -> dict:
+    return dict(
+        stop=stop_after_attempt(3),
+        wait=wait_random_exponential(multiplier=1, max=20),
+        retry=retry_if_exception(is_transient_error),
+        reraise=True
+    )
+
+# Decorator for coroutines that call an external API: up to 3 attempts with exponential backoff + jitter
+with_retry = retry(**_retrying_kwargs())
+
+async def stream_with_retry(open_stream: Callable[[], AsyncIterable[str]]) -> AsyncIterator[str]:
+    """
+    Retries opening a token stream until its first token arrives. Once tokens have been
+    yielded a failure is raised as-is, since retrying would duplicate output.
+    """
+    async for attempt in AsyncRetrying(**_retrying_kwargs()):
+        with attempt:
+            stream = open_stream().__aiter__()
+            try:
+                first = await stream.__anext__()
+            except StopAsyncIteration:
+                return
+    yield first
+    async for token in stream:
+        yield token
@@ -0,0 +1,42 @@
+# src/utils/tokens.py
+from functools import lru_cache
+from typing import Optional
+import tiktoken
+
+TRUNCATION_MARKER = "\n[... content truncated ...]\n"
+# Rough average for English text, used only when no tokenizer is available
+CHARS_PER_TOKEN = 4
+
+@lru_cache(maxsize=None)
+def _encoding(model: str) -> Optional[tiktoken.Encoding]:
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            # Deployment names don't always map to a known model; gpt-4o's encoding is the sensible default
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # tiktoken downloads encodings on first use; offline, trimming falls back to a character estimate
+        print(f"[Tokens] Could not load a tiktoken encoding, trimming by characters instead: {e}")
+        return None
+
+def trim_to_tokens(text: str, max_tokens: int, model: str = "gpt-4o") -> str:
+    """
+    Truncates text to roughly max_tokens tokens, keeping its head and tail and dropping the middle.
+    Text that already fits is returned unchanged. Tokenizing long text is CPU bound, so async callers
+    should run this in a worker thread.
+    """
+    encoding = _encoding(model)
+    if encoding is None:
+        max_chars = max_tokens * CHARS_PER_TOKEN
+        if len(text) <= max_chars:
+            return text
+        head = max_chars // 2
+        tail = max_chars - head
+        return text[:head] + TRUNCATION_MARKER + text[-tail:]
+    tokens = encoding.encode(text)
+    if len(tokens) <= max_tokens:
+        return text
+    head = max_tokens // 2
+    tail = max_tokens - head
+    return encoding.decode(tokens[:head]) + TRUNCATION_MARKER + encoding.decode(tokens[-tail:])